@@ -5,10 +5,18 @@ URL: Link to your web application on Streamlit Cloud (if posted)
 
 Description:  This program provides insights into the Fortune 500 dataset by allowing users to upload a CSV file containing information about top fortune 500 companies of a determine fiscal year.
 Users can explore key data points such as revenues, profits, and employee counts across various states and counties.
-The program offers a range of interactive queries, including selecting the top companies by revenue, analyzing profit margins by state, and comparing revenue growth across states.
+The program offers a range of interactive queries, including selecting the top companies by revenue, analyzing profit margins by state, and comparing average revenue across states.
 Visualizations include bar charts, scatter plots, and tables, which help users understand the distribution of companies by revenue, profit margins, and employee counts, as well as explore county-based statistics like the number of companies and total employee counts. """
+import glob
+import hashlib
+import os
+import tempfile
 import streamlit as st
 import pandas as pd
+import numpy as np
+import numba
+import pyarrow as pa
+import pyarrow.compute as pc
 import plotly.express as px
 
 # [ST4] Set up the page configuration
@@ -17,38 +25,210 @@ st.set_page_config(page_title="Fortune 500 Insights", layout="wide")
 # Add a title for the insights
 st.title("Fortune 500 Companies Insights")
 
+# Columns the app needs in the uploaded CSV
+required_columns = ['REVENUES', 'PROFIT', 'EMPLOYEES', 'NAME', 'STATE', 'COUNTY']
+
+# Parquet snapshots of cleaned uploads: bump the version whenever load_data's cleaning changes so old
+# snapshots are no longer used, and keep only the most recently used ones on disk
+snapshot_version = 1
+max_snapshots = 20
+
+def prune_snapshots():
+    # Delete the least recently used snapshots (of any version) beyond max_snapshots
+    snapshots = sorted(glob.glob(os.path.join(tempfile.gettempdir(), "f500_*.parquet")), key=os.path.getmtime)
+    for path in snapshots[:-max_snapshots]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Already removed by another session
+
 # [DA1] Load and clean data
 @st.cache_data
 def load_data(uploaded_file):
+    # The Streamlit cache lives in memory and is lost on restart, so also keep a Parquet snapshot of the
+    # cleaned data on disk, keyed by the file contents, and reuse it instead of parsing and cleaning again
+    file_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    snapshot_path = os.path.join(tempfile.gettempdir(), f"f500_v{snapshot_version}_{file_hash}.parquet")
+    if os.path.exists(snapshot_path):
+        try:
+            # Parquet doesn't round-trip every pandas dtype, so restore the ones a fresh CSV read produces
+            df = pd.read_parquet(snapshot_path, engine='pyarrow', dtype_backend='pyarrow')
+            df = df.astype({'NAME': 'string[pyarrow]', 'STATE': 'category', 'COUNTY': 'category'})
+            os.utime(snapshot_path)  # Mark as recently used for prune_snapshots
+            return df
+        except Exception:
+            pass  # Unreadable snapshot: rebuild it from the CSV below
+
     # [PY3] Error checking with try/except - Try reading the data from the uploaded CSV file
     try:
-        df = pd.read_csv(uploaded_file)
+        try:
+            # The pyarrow engine parses in parallel into Arrow-backed columns, with states and counties
+            # dictionary-encoded as categories straight away
+            df = pd.read_csv(uploaded_file, engine='pyarrow', dtype_backend='pyarrow',
+                             dtype={'STATE': 'category', 'COUNTY': 'category', 'NAME': 'string[pyarrow]'})
+        except Exception:
+            # Fall back to the default parser for files the pyarrow engine can't handle
+            uploaded_file.seek(0)
+            df = pd.read_csv(uploaded_file)
     except Exception as e:
         st.error(f"Error reading file: {str(e)}")
         return pd.DataFrame()  # Return an empty DataFrame in case of error
 
-    # Debugging: print out column names to help identify issues
-    st.write("### Columns in the uploaded dataset:")
-    st.write(df.columns)
-
-    #  Check if necessary columns exist
-    required_columns = ['REVENUES', 'PROFIT', 'EMPLOYEES', 'NAME', 'STATE', 'COUNTY']
-    #[PY4] A list comprehension:
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        st.error(f"Missing columns in the uploaded data: {', '.join(missing_columns)}")
+    # Only clean the data if the necessary columns exist; missing ones are reported outside the cached
+    # function so the error isn't replayed from the cache
+    if not set(required_columns).issubset(df.columns):
         return df
 
     # Clean the data by dropping rows with missing values in key columns
     df = df.dropna(subset=['REVENUES', 'PROFIT', 'EMPLOYEES'])
 
-    # [DA1] Lambda function to clean columns by removing dollar signs and commas, and convert to appropriate types
-    df['REVENUES'] = df['REVENUES'].apply(lambda x: float(str(x).replace('$', '').replace(',', '')) if isinstance(x, str) else x)
-    df['PROFIT'] = df['PROFIT'].apply(lambda x: float(str(x).replace('$', '').replace(',', '')) if isinstance(x, str) else x)
-    df['EMPLOYEES'] = df['EMPLOYEES'].apply(lambda x: int(str(x).replace(',', '')) if isinstance(x, str) else x)
+    # [DA1] Clean columns by removing dollar signs and commas, and convert to appropriate types
+    # The str accessor does this for the whole column at once instead of calling Python once per row
+    for col, downcast, arrow_type in (('REVENUES', 'float', pa.float32()), ('PROFIT', 'float', pa.float32()),
+                                      ('EMPLOYEES', 'integer', pa.int64())):
+        if df[col].dtype == object:
+            df[col] = df[col].astype(str).str.replace(r'[$,]', '', regex=True)
+        elif pd.api.types.is_string_dtype(df[col]):
+            # Arrow-backed strings (pyarrow reader): strip and cast with Arrow kernels, without a pandas str copy
+            cleaned = pc.replace_substring(pc.replace_substring(pa.array(df[col].array), '$', ''), ',', '')
+            try:
+                cleaned = pc.cast(cleaned, arrow_type)
+            except pa.ArrowInvalid:
+                pass  # Leave values that aren't numbers for pd.to_numeric to coerce to NaN below
+            df[col] = pd.Series(pd.arrays.ArrowExtensionArray(cleaned), index=df.index)
+        # Numeric and all-null (null[pyarrow]) columns go straight to pd.to_numeric
+        # Downcast to the smallest numeric type (float32 / int32) to halve the memory touched by every aggregate
+        df[col] = pd.to_numeric(df[col], errors='coerce', downcast=downcast)
+
+    # States and counties repeat a lot, so store them as categories (small integer codes instead of Python strings)
+    # (dropping categories that no longer appear after the dropna above)
+    df['STATE'] = df['STATE'].astype('category').cat.remove_unused_categories()
+    df['COUNTY'] = df['COUNTY'].astype('category').cat.remove_unused_categories()
+
+    # Write to a temporary name first so another session never reads a half-written snapshot
+    partial_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(partial_path, engine='pyarrow', compression='snappy')
+        os.replace(partial_path, snapshot_path)
+        prune_snapshots()
+    except Exception:
+        # The snapshot is only an optimisation; the app works without it
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
 
     return df
 
+# Cached aggregates so that slider/selectbox reruns reuse them instead of recomputing over the full DataFrame
+@st.cache_data
+def state_revenue_stats(df):
+    # [PY5] & [DA6] Total and average revenue by state in a single groupby pass
+    # (kept sorted by state, since these tables are displayed in this order)
+    # REVENUES is stored as float32; aggregate in float64 so the averages don't show float32 rounding error
+    revenues = df['REVENUES'].astype('float64')
+    return revenues.groupby(df['STATE'], observed=True).agg(TOTAL_REVENUE='sum', AVG_REVENUE='mean').reset_index()
+
+@st.cache_resource
+def state_groups(df):
+    # Split the companies by state once so the selectbox can look a state up instead of scanning every row.
+    # cache_resource hands back the stored dict itself (cache_data would unpickle a copy of every group on
+    # each rerun); callers must not modify the groups in place
+    return {state: group for state, group in df.groupby('STATE', observed=True, sort=False)}
+
+@st.cache_data
+def top_revenue_companies(df, n=50):
+    # Only the top n companies are ever shown, so select them instead of sorting the whole DataFrame
+    return df[['NAME', 'REVENUES']].nlargest(n, 'REVENUES')
+
+@st.cache_data
+def county_stats(df):
+    # Number of companies and total employees per county in a single groupby pass
+    # (unsorted: the charts pick their own order with nlargest)
+    return df.groupby('COUNTY', observed=True, sort=False).agg(NUM_COMPANIES=('NAME', 'size'),
+                                                               EMPLOYEES=('EMPLOYEES', 'sum')).reset_index()
+
+@st.cache_resource
+def profit_margin_kernel():
+    # Compiled once per process (a module-level @numba.njit would be redefined and recompiled on every rerun).
+    # Serial on purpose: each Streamlit session runs in its own thread, and Numba's parallel threading layers
+    # are either unsafe to call from several threads at once or hang the server on shutdown
+    @numba.njit(fastmath=True)
+    def kernel(revenues, profits, out):
+        for i in range(len(revenues)):
+            out[i] = 0.0 if revenues[i] == 0 else profits[i] / revenues[i] * 100.0
+    return kernel
+
+def profit_margin(state_data):
+    # Profit margin in percent for every company (0 where revenue is 0)
+    revenues = state_data['REVENUES'].to_numpy(dtype=np.float32, na_value=np.nan)
+    profits = state_data['PROFIT'].to_numpy(dtype=np.float32, na_value=np.nan)
+    # Large uploads use the compiled Numba kernel; for small ones the JIT compile would cost more than it saves
+    if len(revenues) >= 100_000:
+        out = np.empty(len(revenues), dtype=np.float32)
+        profit_margin_kernel()(revenues, profits, out)
+        return out
+    return np.where(revenues != 0, profits / np.where(revenues == 0, 1.0, revenues) * 100.0, 0.0)
+
+# Cached figure builders: a rerun only rebuilds the charts whose inputs actually changed
+@st.cache_data
+def build_top_companies_fig(top_companies, top_x):
+    #[VIZ1] Bar chart displaying the revenues
+    return px.bar(top_companies, x='NAME', y='REVENUES', title=f"Top {top_x} Companies by Revenue",
+                  labels={'REVENUES': 'Revenue ($)', 'NAME': 'Company'})
+
+@st.cache_data
+def build_profit_margin_fig(state_data, state):
+    #[VIZ2] Create a scatter plot to show the profit margin for each company
+    fig2 = px.scatter(
+        state_data,
+        x='NAME',  # Company names on the x-axis
+        y='PROFIT_MARGIN',  # Profit margins on the y-axis
+        title=f"Profit Margins for Companies in {state}",
+        labels={'NAME': 'Company Name', 'PROFIT_MARGIN': 'Profit Margin (%)'},
+        hover_data=['REVENUES', 'PROFIT'],  # Additional data to display on hover
+        render_mode='webgl',  # Draw the points with WebGL so large uploads stay responsive
+    )
+
+    # Improve layout for readability
+    fig2.update_layout(
+        xaxis_tickangle=45,  # Rotate x-axis labels for better readability
+        margin=dict(l=40, r=40, t=50, b=100),  # Adjust margins
+        hovermode='x',  # Hit-test along the x-axis only, which is much cheaper than 'closest' on dense plots
+    )
+    return fig2
+
+@st.cache_data
+def build_county_companies_fig(county_count_chart):
+    # vertical bar chart showing top counties by number of companies
+    fig4a = px.bar(
+        county_count_chart,
+        x='COUNTY',
+        y='NUM_COMPANIES',
+        orientation='v',  # vertical bar chart
+        title="Top Counties by Number of Companies",
+        labels={'NUM_COMPANIES': 'Number of Companies', 'COUNTY': 'County'},
+    )
+
+    # Keep the bars in the order the rows were sorted in pandas (most companies first) instead of having
+    # plotly.js sort the categories again in the browser
+    fig4a.update_layout(xaxis=dict(categoryorder='array', categoryarray=county_count_chart['COUNTY'].tolist()))
+    # Plain hover label instead of the default formatted hover box
+    fig4a.update_traces(hovertemplate='%{x}: %{y}<extra></extra>')
+    return fig4a
+
+@st.cache_data
+def build_county_employees_fig(county_employee_chart):
+    # Horizontal bar chart showing top counties by total employee count
+    fig4b = px.bar(county_employee_chart, x='EMPLOYEES', y='COUNTY', orientation='h',
+                   title="Top Counties by Total Employee Count",
+                   labels={'EMPLOYEES': 'Total Employees', 'COUNTY': 'County'})
+
+    # Rows are already sorted by total employees; horizontal bars are drawn bottom-up, so reverse the order
+    # to put the largest county at the top
+    fig4b.update_layout(yaxis=dict(categoryorder='array',
+                                   categoryarray=county_employee_chart['COUNTY'].tolist()[::-1]))
+    fig4b.update_traces(hovertemplate='%{y}: %{x:,}<extra></extra>')
+    return fig4b
+
 # [ST1] File uploader widget for CSV
 uploaded_file = st.file_uploader("Upload your Fortune 500 dataset", type="csv")
 
@@ -57,69 +237,63 @@ if uploaded_file is not None:
     # Load the data
     df = load_data(uploaded_file)
 
+    # Debugging: print out column names to help identify issues (only when a debug flag is set in the session)
+    if st.session_state.get('debug'):
+        st.write("### Columns in the uploaded dataset:")
+        st.write(df.columns.tolist())
+
+    #  Check if necessary columns exist
+    #[PY4] A list comprehension:
+    missing_columns = [col for col in required_columns if col not in df.columns]
+
     # Check if the data loaded correctly
-    if df.empty:
+    if missing_columns and not df.empty:
+        st.error(f"Missing columns in the uploaded data: {', '.join(missing_columns)}")
+    elif df.empty:
         st.error("No data to display due to missing columns or other issues.")
     else:
-        # [PY5] Create a dictionary mapping state to total revenue
-        state_revenue_dict = dict(df.groupby('STATE')['REVENUES'].sum())
-
-        # Convert the dictionary into a DataFrame for better visualization
-        state_revenue_df = pd.DataFrame(list(state_revenue_dict.items()), columns=['STATE', 'TOTAL_REVENUE'])
+        # [PY5] Total and average revenue by state
+        state_stats = state_revenue_stats(df)
+        state_revenue_df = state_stats[['STATE', 'TOTAL_REVENUE']]
 
         # Display the total revenue by state as a table
         st.write("### Total Revenue by State:")
-        st.write(state_revenue_df)
+        st.dataframe(state_revenue_df, use_container_width=True, hide_index=True)
 
         # [DA2] & [ST2] What is the total revenue of the top X companies?
         top_x = st.slider("Select top X companies", min_value=1, max_value=50, step=1, value=10)
 
-        top_companies = df[['NAME', 'REVENUES']].sort_values(by='REVENUES', ascending=False).head(top_x)
+        top_companies = top_revenue_companies(df).head(top_x)
         total_revenue = top_companies['REVENUES'].sum()
 
         st.write(f"### Total Revenue of the Top {top_x} Companies: ${total_revenue:,.2f}")
 
         #[VIZ1] Bar chart displaying the revenues
-        fig = px.bar(top_companies, x='NAME', y='REVENUES', title=f"Top {top_x} Companies by Revenue",
-                     labels={'REVENUES': 'Revenue ($)', 'NAME': 'Company'})
+        fig = build_top_companies_fig(top_companies, top_x)
         st.plotly_chart(fig)
 
-        # [DA6] & [VIZ2] Create a pivot table for average revenue by state
-        pivot_table = df.pivot_table(values='REVENUES', index='STATE', aggfunc='mean').reset_index()
+        # [DA6] & [VIZ2] Average revenue by state
+        avg_revenue_df = state_stats[['STATE', 'AVG_REVENUE']]
         st.write("### Average Revenue by State")
-        st.write(pivot_table)
+        st.dataframe(avg_revenue_df, use_container_width=True, hide_index=True)
 
         #[ST3]select box: What is the average profit margin of companies in <state>?
-        state = st.selectbox("Select a state for Profit Margin", df['STATE'].unique())
+        # Offer the same states the groups were built from (groupby leaves out rows without a state)
+        groups = state_groups(df)
+        state = st.selectbox("Select a state for Profit Margin", list(groups))
 
         # Filter data for the selected state
-        state_data = df[df['STATE'] == state]
+        state_data = groups[state]
 
-        # Calculate the profit margin using a lambda function
-        state_data['PROFIT_MARGIN'] = state_data.apply(
-            lambda row: row['PROFIT'] / row['REVENUES'] * 100 if row['REVENUES'] != 0 else 0,
-            axis=1
-        )
+        # Calculate the profit margin for the whole column at once
+        state_data = state_data.assign(PROFIT_MARGIN=profit_margin(state_data))
         avg_profit_margin = state_data['PROFIT_MARGIN'].mean()
 
         # Display the average profit margin
         st.write(f"### Average Profit Margin for Companies in {state}: {avg_profit_margin:.2f}%")
 
-        #[VIZ2] Create a scatter plot to show the profit margin for each company
-        fig2 = px.scatter(
-            state_data,
-            x='NAME',  # Company names on the x-axis
-            y='PROFIT_MARGIN',  # Profit margins on the y-axis
-            title=f"Profit Margins for Companies in {state}",
-            labels={'NAME': 'Company Name', 'PROFIT_MARGIN': 'Profit Margin (%)'},
-            hover_data=['REVENUES', 'PROFIT'],  # Additional data to display on hover
-        )
-
-        # Improve layout for readability
-        fig2.update_layout(
-            xaxis_tickangle=45,  # Rotate x-axis labels for better readability
-            margin=dict(l=40, r=40, t=50, b=100),  # Adjust margins
-        )
+        #[VIZ2] Scatter plot of the profit margin for each company
+        fig2 = build_profit_margin_fig(state_data, state)
 
         # Display the scatter plot
         st.plotly_chart(fig2)
@@ -128,61 +302,52 @@ if uploaded_file is not None:
         avg_employees = state_data['EMPLOYEES'].mean()
         st.write(f"### Average Number of Employees for Companies in {state}: {avg_employees:,.0f}")
 
-        # How does the revenue growth in <state> compare to the national average?
-        state_revenue_growth = state_data['REVENUES'].pct_change() * 100  # Percentage change in revenues
-        national_avg_growth = df['REVENUES'].pct_change().mean() * 100
-
-        state_avg_growth = state_revenue_growth.mean()
+        # How does the average company revenue in <state> compare to the national average?
+        # (pct_change between adjacent rows depended on the file's row order, so compare means instead)
+        state_mean_revenue = state_data['REVENUES'].mean()
+        national_mean_revenue = df['REVENUES'].mean()
+        revenue_difference = (state_mean_revenue - national_mean_revenue) / national_mean_revenue * 100
 
-        st.write(f"### Revenue Growth in {state} compared to the National Average")
-        st.write(f"State Average Revenue Growth: {state_avg_growth:.2f}%")
-        st.write(f"National Average Revenue Growth: {national_avg_growth:.2f}%")
+        st.write(f"### Average Revenue in {state} compared to the National Average")
+        st.write(f"State Average Revenue: ${state_mean_revenue:,.2f}")
+        st.write(f"National Average Revenue: ${national_mean_revenue:,.2f}")
+        st.write(f"Difference from the National Average: {revenue_difference:+.2f}%")
 
 
         # [MAP] Display a map showing locations of Fortune 500 companies
         st.write("### Map of Fortune 500 Companies by Location")
-        company_locations = df[['NAME', 'LATITUDE', 'LONGITUDE']]
+        # st.map only uses the coordinates, so send just those and skip rows without a location
+        company_locations = df[['LATITUDE', 'LONGITUDE']].dropna()
         st.map(company_locations)
 
+        county_agg = county_stats(df)
+        # Thousands of bars are unreadable and slow to draw, so only chart the top 50 counties for large uploads
+        chart_counties = 50 if len(county_agg) > 2000 else len(county_agg)
+
         # [DA3]&[PY2] Which county has the most Fortune 500 companies?
-        county_company_count = df['COUNTY'].value_counts().reset_index()
-        county_company_count.columns = ['COUNTY', 'NUM_COMPANIES']
-        top_county_by_companies = county_company_count.sort_values(by='NUM_COMPANIES', ascending=False).head(1)
+        county_company_count = county_agg.nlargest(chart_counties, 'NUM_COMPANIES')[['COUNTY', 'NUM_COMPANIES']]
+        # Sorted by count, so the top county is the first row
+        top_county = county_company_count['COUNTY'].iat[0]
+        top_county_companies = county_company_count['NUM_COMPANIES'].iat[0]
 
         st.write(
-            f"### County with the Most Fortune 500 Companies: {top_county_by_companies['COUNTY'].iloc[0]} (Companies: {top_county_by_companies['NUM_COMPANIES'].iloc[0]})"
+            f"### County with the Most Fortune 500 Companies: {top_county} (Companies: {top_county_companies})"
         )
 
         # vertical bar chart showing top counties by number of companies
-        fig4a = px.bar(
-            county_company_count,
-            x='COUNTY',
-            y='NUM_COMPANIES',
-            orientation='v',  # vertical bar chart
-            title="Top Counties by Number of Companies",
-            labels={'NUM_COMPANIES': 'Number of Companies', 'COUNTY': 'County'},
-        )
-
-        # Sort the bars by the number of companies in descending order
-        fig4a.update_layout(yaxis=dict(categoryorder='total ascending'))
-
+        fig4a = build_county_companies_fig(county_company_count)
         st.plotly_chart(fig4a)
 
 
         # [DA4] Which county has the highest total employee count across all Fortune 500 companies?
-        county_data = df[['COUNTY', 'EMPLOYEES']].groupby('COUNTY').sum().reset_index()
-        top_county_by_employees = county_data.sort_values(by='EMPLOYEES', ascending=False).head(1)
+        county_data = county_agg.nlargest(chart_counties, 'EMPLOYEES')[['COUNTY', 'EMPLOYEES']]
+        top_county_by_employees = county_data.head(1)
 
         st.write(
             f"### County with the Highest Total Employee Count Across All Fortune 500 Companies: {top_county_by_employees['COUNTY'].iloc[0]} (Employees: {top_county_by_employees['EMPLOYEES'].iloc[0]:,})"
         )
 
         # Horizontal bar chart showing top counties by total employee count
-        fig4b = px.bar(county_data, x='EMPLOYEES', y='COUNTY', orientation='h',
-                       title="Top Counties by Total Employee Count",
-                       labels={'EMPLOYEES': 'Total Employees', 'COUNTY': 'County'})
-
-        # Sort the bars by total employees in descending order
-        fig4b.update_layout(xaxis=dict(categoryorder='total descending'))
+        fig4b = build_county_employees_fig(county_data)
 
         st.plotly_chart(fig4b)